@@ -1,32 +1,473 @@
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+import hashlib
+import json
+import random
 import time
 import os
+from functools import lru_cache
+
+import aiohttp
+import diskcache
+
+import httpx
+import tiktoken
+from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_exception_type
+
+_HTTPX_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=128)
+_HTTPX_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_client = None
+_async_client = None
+
+
+def _get_client():
+    # One client (and one connection pool) for the whole process: building
+    # OpenAI() per call re-does TLS handshakes and starves the pool under
+    # concurrency. HTTP/2 multiplexes concurrent completions per connection.
+    global _client
+    if _client is None:
+        _client = OpenAI(http_client=httpx.Client(limits=_HTTPX_LIMITS, http2=True, timeout=_HTTPX_TIMEOUT))
+    return _client
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(http_client=httpx.AsyncClient(limits=_HTTPX_LIMITS, http2=True, timeout=_HTTPX_TIMEOUT))
+    return _async_client
+
+
+_OPENAI_CHAT_URL = 'https://api.openai.com/v1/chat/completions'
+_aiohttp_session = None
+
+
+def _get_aiohttp_session():
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        _aiohttp_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=200))
+    return _aiohttp_session
+
+
+async def _acreate_aiohttp(body, max_attempts=8):
+    # Raw POST to the chat endpoint: skips the per-request object
+    # construction of the openai client, which bottlenecks at high
+    # concurrency. Same jittered backoff policy as the tenacity path.
+    session = _get_aiohttp_session()
+    headers = {'Authorization': 'Bearer %s' % os.environ['OPENAI_API_KEY']}
+    for attempt in range(max_attempts):
+        async with session.post(_OPENAI_CHAT_URL, headers=headers, json=body) as resp:
+            if resp.status == 200:
+                return await resp.json()
+            if resp.status == 429 or resp.status >= 500:
+                retry_after = resp.headers.get('retry-after')
+                error = await resp.text()
+            else:
+                raise RuntimeError('OpenAI API error %d: %s' % (resp.status, await resp.text()))
+        if retry_after is not None:
+            delay = float(retry_after)
+        else:
+            delay = random.uniform(0, min(60, 0.1 * 2 ** attempt))
+        await asyncio.sleep(delay)
+    raise RuntimeError('OpenAI API error after %d attempts: %s' % (max_attempts, error))
+
+# Completions at temperature 0 are deterministic for a given prompt, so they
+# are served from a content-addressed disk cache across runs and roles.
+# Flip cache_enabled off (main.py --no-cache) to force fresh API calls.
+cache_enabled = True
+_response_cache = None
+
+# Upper bound on context_length_exceeded -> trim -> retry cycles per call,
+# matching the bounded attempt loop the old implementation had.
+_MAX_OVERFLOW_ATTEMPTS = 20
+
+# Whether the provider honours n= for multi-sample requests. OpenAI does;
+# set to False for local or proxy backends that ignore n, and majority
+# sampling fans out as concurrent single-sample requests instead.
+supports_n = True
+
+
+def _get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = diskcache.Cache(
+            os.environ.get('LLM_CACHE_DIR', os.path.expanduser('~/.cache/self-collab-llm')))
+    return _response_cache
+
+
+def _cache_key(prompt, model, max_tokens, temperature, top_p, majority_at):
+    payload = json.dumps({'messages': prompt, 'model': model, 'max_tokens': max_tokens,
+                          'temperature': temperature, 'top_p': top_p, 'majority': majority_at},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+_MAX_CONTEXT_LENGTH = {
+    'gpt-3.5-turbo-0301': 4096,
+    'gpt-3.5-turbo': 4096,
+    'gpt-3.5-turbo-16k': 16384,
+    'gpt-4-0613': 8192,
+    'gpt-4': 8192,
+}
+
+
+def max_context_length(model):
+    return _MAX_CONTEXT_LENGTH.get(model, 4096)
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+# Pre-warm the common encodings so the first request doesn't pay the
+# cold-load cost of encoding_for_model.
+_get_encoding('gpt-3.5-turbo')
+_get_encoding('gpt-4')
+
+
+# Opportunistic identity cache for every string that passes through token
+# counting: requirement and report strings are shared between role histories
+# as the same long-lived objects, so an id() lookup skips both hashing the
+# content and re-encoding it. Entries hold (string, count): keeping the
+# reference pins the id so a recycled address can never alias a different
+# string, and lookups double-check identity before trusting the count.
+# Cleared wholesale when it grows too large.
+_ID_TOKEN_CACHE = {}
+_ID_TOKEN_CACHE_LIMIT = 10000
+
+
+@lru_cache(maxsize=4096)
+def _count_message_tokens(model, message_key):
+    # message_key is frozenset(message.items()); messages are never mutated
+    # in place, so the cached count stays valid for the whole run.
+    encoding = _get_encoding(model)
+    num_tokens = 4  # <|start|>{role}\n{content}<|end|>\n
+    pending = []
+    for key, value in message_key:
+        cached = _ID_TOKEN_CACHE.get(id(value))
+        if cached is not None and cached[0] is value:
+            num_tokens += cached[1]
+        else:
+            pending.append(value)
+    if pending:
+        token_lists = encoding.encode_ordinary_batch(pending, num_threads=os.cpu_count())
+        if len(_ID_TOKEN_CACHE) > _ID_TOKEN_CACHE_LIMIT:
+            _ID_TOKEN_CACHE.clear()
+        for value, tokens in zip(pending, token_lists):
+            _ID_TOKEN_CACHE[id(value)] = (value, len(tokens))
+        num_tokens += sum(len(tokens) for tokens in token_lists)
+    return num_tokens
+
+
+def _per_message_tokens(messages, model='gpt-3.5-turbo-0301'):
+    return [_count_message_tokens(model, frozenset(message.items())) for message in messages]
+
+
+def count_tokens(messages, model='gpt-3.5-turbo-0301'):
+    """Count prompt tokens the way the chat endpoint bills them: a fixed
+    per-message overhead plus the tokens of every string value."""
+    num_tokens = sum(_per_message_tokens(messages, model))
+    num_tokens += 2  # every reply is primed with <|start|>assistant
+    return num_tokens
+
+
+def truncate_messages(messages, model='gpt-3.5-turbo-0301', max_prompt_tokens=3072, num_prefix_messages=1,
+        per_message_tokens=None):
+    """Keep the cacheable prefix untouched and as many of the most recent
+    suffix messages as fit in max_prompt_tokens, dropping the oldest first.
+    The prefix is never evicted or reordered, so the provider's prompt
+    cache keeps hitting on the static role description across rounds."""
+    if per_message_tokens is None:
+        per_message_tokens = _per_message_tokens(messages, model)
+    if sum(per_message_tokens) + 2 <= max_prompt_tokens:
+        return messages
+
+    # Scan from the tail with the precomputed counts — no tokenizer work
+    # happens inside this loop. Collect the kept tail and reverse once at
+    # the end; list.insert inside the loop would be O(N) per message.
+    budget = max_prompt_tokens - sum(per_message_tokens[:num_prefix_messages]) - 2
+    tail = []
+    for message, message_tokens in zip(reversed(messages[num_prefix_messages:]),
+                                       reversed(per_message_tokens[num_prefix_messages:])):
+        if message_tokens > budget:
+            break
+        budget -= message_tokens
+        tail.append(message)
+    return list(messages[:num_prefix_messages]) + tail[::-1]
+
+
+def adjust_max_tokens(messages, model='gpt-3.5-turbo-0301', max_tokens=512, num_prefix_messages=1):
+    """Trim the prompt and/or the completion budget so that the request fits
+    in the model context window."""
+    max_context_length = _MAX_CONTEXT_LENGTH.get(model, 4096)
+
+    # Cheap character-based upper bound (a token is ~4 chars, len/3 is
+    # conservative): most HumanEval prompts are nowhere near the context
+    # limit, so skip exact tokenization entirely unless near the boundary.
+    approx_tokens = sum(len(value) for message in messages for value in message.values()) // 3
+    if approx_tokens + max_tokens + 200 < max_context_length:
+        return messages, max_tokens
+
+    per_message_tokens = _per_message_tokens(messages, model)
+    prompt_tokens = sum(per_message_tokens) + 2
+    if prompt_tokens + max_tokens <= max_context_length:
+        return messages, max_tokens
+
+    messages = truncate_messages(messages, model, max_context_length - max_tokens, num_prefix_messages,
+                                 per_message_tokens)
+    prompt_tokens = count_tokens(messages, model)
+    if prompt_tokens + max_tokens > max_context_length:
+        max_tokens = max_context_length - prompt_tokens
+    return messages, max_tokens
+
+
+def _trim_on_context_overflow(prompt, model, max_tokens, num_prefix_messages):
+    # Recovery path for context_length_exceeded: the character fast path in
+    # adjust_max_tokens was too optimistic, so don't go through it again.
+    # Halve the completion budget and drop the oldest suffix messages using
+    # the cached per-message counts.
+    max_tokens = max(max_tokens // 2, 1)
+    max_context_length = _MAX_CONTEXT_LENGTH.get(model, 4096)
+    per_message_tokens = _per_message_tokens(prompt, model)
+    prompt = truncate_messages(prompt, model, max_context_length - max_tokens, num_prefix_messages,
+                               per_message_tokens)
+    return prompt, max_tokens
+
+
+def _wait_retry_after(retry_state):
+    # Honor the server-provided Retry-After header when present, otherwise
+    # fall back to jittered exponential backoff.
+    exception = retry_state.outcome.exception()
+    response = getattr(exception, 'response', None)
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return wait_random_exponential(multiplier=0.1, max=60)(retry_state)
+
+
+_llm_retry = retry(
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError)),
+    wait=_wait_retry_after,
+    stop=stop_after_attempt(8),
+    reraise=True,
+)
+
+
+@_llm_retry
+def _create(client, **request):
+    return client.chat.completions.create(**request)
+
+
+@_llm_retry
+async def _acreate(client, **request):
+    return await client.chat.completions.create(**request)
 
 
 def call_chatgpt(prompt, model='code-davinci-002', stop=None, temperature=0., top_p=1.0,
-        max_tokens=128, echo=False, majority_at=None):
+        max_tokens=128, echo=False, majority_at=None, num_prefix_messages=1):
     
-    client = OpenAI()
+    client = _get_client()
+    num_completions = majority_at if majority_at is not None else 1
+    # The endpoint accepts n up to 128 per request and only bills the prompt
+    # tokens once, so ask for all remaining samples in one round trip
+    # instead of batches of 10.
+    num_completions_batch_size = 128
+
+    cacheable = cache_enabled and temperature == 0
+    if cacheable:
+        cache_key = _cache_key(prompt, model, max_tokens, temperature, top_p, majority_at)
+        cached = _get_response_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+    prompt, max_tokens = adjust_max_tokens(prompt, model, max_tokens, num_prefix_messages)
+
+    completions = []
+    overflow_attempts = 0
+    while len(completions) < num_completions:
+        requested_completions = min(num_completions_batch_size, num_completions - len(completions))
+
+        try:
+            response = _create(
+                client,
+                model=model,
+                messages=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                n=requested_completions
+            )
+        except openai.BadRequestError as e:
+            # Branch on the structured error code: str(e) serializes the
+            # whole response body and can false-match on unrelated errors.
+            if getattr(e, 'code', None) == 'context_length_exceeded':
+                # Trimming cannot shrink the protected prefix, so a prompt
+                # that still overflows after repeated trims never will fit;
+                # give up instead of hammering the API forever.
+                overflow_attempts += 1
+                if overflow_attempts > _MAX_OVERFLOW_ATTEMPTS:
+                    raise RuntimeError('Failed to call GPT API') from e
+                prompt, max_tokens = _trim_on_context_overflow(prompt, model, max_tokens, num_prefix_messages)
+                continue
+            raise
+        completions.extend([choice.message.content for choice in response.choices])
+
+    completions = completions[:num_completions]
+    if cacheable:
+        _get_response_cache().set(cache_key, completions)
+    return completions
+
+
+def call_chatgpt_batch(prompts, model='gpt-3.5-turbo-0301', temperature=0., top_p=1.0,
+        max_tokens=512, poll_interval=30):
+    """Send one chat request per prompt through the OpenAI Batch API and block
+    until the batch finishes. `prompts` maps custom ids to message lists;
+    returns {custom_id: completion text or None on per-request failure}."""
+
+    client = _get_client()
+
+    lines = []
+    for custom_id, prompt in prompts.items():
+        lines.append(json.dumps({
+            'custom_id': str(custom_id),
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {
+                'model': model,
+                'messages': prompt,
+                'max_tokens': max_tokens,
+                'temperature': temperature,
+                'top_p': top_p,
+            },
+        }))
+
+    # The Files API requires a .jsonl filename for purpose='batch'; a bare
+    # BytesIO uploads under a default name the endpoint rejects.
+    batch_file = client.files.create(file=('batch.jsonl', '\n'.join(lines).encode('utf-8')),
+                                     purpose='batch')
+    batch = client.batches.create(input_file_id=batch_file.id, endpoint='/v1/chat/completions',
+                                  completion_window='24h')
+    while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+
+    if batch.status != 'completed' or batch.output_file_id is None:
+        raise RuntimeError('Batch %s finished with status %s' % (batch.id, batch.status))
+
+    completions = {custom_id: None for custom_id in prompts}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        result = json.loads(line)
+        response = result.get('response')
+        if response and response.get('status_code') == 200:
+            completions[result['custom_id']] = response['body']['choices'][0]['message']['content']
+    return completions
+
+
+async def acall_chatgpt(prompt, model='code-davinci-002', stop=None, temperature=0., top_p=1.0,
+        max_tokens=128, echo=False, majority_at=None, backend='openai', num_prefix_messages=1,
+        stream=False):
+
+    if majority_at is not None and majority_at > 1 and not supports_n:
+        # No native n= batching: take the samples as parallel single-sample
+        # requests rather than a sequential loop, so wall time stays close
+        # to one request instead of growing with majority_at. Top-level
+        # task concurrency is already bounded by the semaphore in main.py.
+        results = await asyncio.gather(*[
+            acall_chatgpt(prompt, model=model, stop=stop, temperature=temperature, top_p=top_p,
+                          max_tokens=max_tokens, echo=echo, majority_at=None, backend=backend,
+                          num_prefix_messages=num_prefix_messages)
+            for _ in range(majority_at)])
+        return [completion for result in results for completion in result]
+
+    client = _get_async_client()
     num_completions = majority_at if majority_at is not None else 1
-    num_completions_batch_size = 10
+    # The endpoint accepts n up to 128 per request and only bills the prompt
+    # tokens once, so ask for all remaining samples in one round trip
+    # instead of batches of 10.
+    num_completions_batch_size = 128
+
+    cacheable = cache_enabled and temperature == 0
+    if cacheable:
+        cache_key = _cache_key(prompt, model, max_tokens, temperature, top_p, majority_at)
+        cached = _get_response_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+    prompt, max_tokens = adjust_max_tokens(prompt, model, max_tokens, num_prefix_messages)
 
     completions = []
-    for i in range(20 * (num_completions // num_completions_batch_size + 1)):
+    overflow_attempts = 0
+    while len(completions) < num_completions:
+        requested_completions = min(num_completions_batch_size, num_completions - len(completions))
+
+        if backend == 'aiohttp':
+            response = await _acreate_aiohttp({
+                'model': model,
+                'messages': prompt,
+                'max_tokens': max_tokens,
+                'temperature': temperature,
+                'top_p': top_p,
+                'n': requested_completions,
+            })
+            completions.extend([choice['message']['content'] for choice in response['choices']])
+            continue
+
         try:
-            requested_completions = min(num_completions_batch_size, num_completions - len(completions))
-
-            response = client.chat.completions.create(
-            model=model,
-            messages=prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            n=requested_completions
+            if stream and requested_completions == 1:
+                # Consume the completion incrementally: tokens accumulate as
+                # they decode instead of blocking until the last one lands.
+                response_stream = await _acreate(
+                    client,
+                    model=model,
+                    messages=prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    n=1,
+                    stream=True
+                )
+                parts = []
+                async for chunk in response_stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                completions.append(''.join(parts))
+                continue
+
+            response = await _acreate(
+                client,
+                model=model,
+                messages=prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                n=requested_completions
             )
-            completions.extend([choice.message.content for choice in response.choices])
-            if len(completions) >= num_completions:
-                return completions[:num_completions]
-        except openai.RateLimitError as e:
-            time.sleep(min(i**2, 60))
-    raise RuntimeError('Failed to call GPT API')
\ No newline at end of file
+        except openai.BadRequestError as e:
+            # Branch on the structured error code: str(e) serializes the
+            # whole response body and can false-match on unrelated errors.
+            if getattr(e, 'code', None) == 'context_length_exceeded':
+                # Trimming cannot shrink the protected prefix, so a prompt
+                # that still overflows after repeated trims never will fit;
+                # give up instead of hammering the API forever.
+                overflow_attempts += 1
+                if overflow_attempts > _MAX_OVERFLOW_ATTEMPTS:
+                    raise RuntimeError('Failed to call GPT API') from e
+                prompt, max_tokens = _trim_on_context_overflow(prompt, model, max_tokens, num_prefix_messages)
+                continue
+            raise
+        completions.extend([choice.message.content for choice in response.choices])
+
+    completions = completions[:num_completions]
+    if cacheable:
+        _get_response_cache().set(cache_key, completions)
+    return completions
@@ -1,26 +1,51 @@
 import io
-import signal
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
 from typing import Any, Callable, List, Optional
 from collections import Counter
 
-from .backend import call_chatgpt
+from .backend import call_chatgpt, acall_chatgpt
 
 
-class timeout:
-    def __init__(self, seconds=1, error_message='Timeout'):
-        self.seconds = seconds
-        self.error_message = error_message
-    def timeout_handler(self, signum, frame):
-        raise TimeoutError(self.error_message)
-    def __enter__(self):
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(self.seconds)
-    def __exit__(self, type, value, traceback):
-        signal.alarm(0)
+def materialize_messages(history):
+    """Expand lightweight (role, content) history tuples into the dict form
+    the chat API expects. Dict messages pass through untouched."""
+    return [message if isinstance(message, dict) else {"role": message[0], "content": message[1]}
+            for message in history]
+
+
+def call_with_timeout(fn, seconds, *args, **kwargs):
+    """Run fn with a wall-clock timeout. Unlike the old SIGALRM-based
+    context manager this works off the main thread, so callers can live in
+    worker threads or alongside the asyncio loop."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        future = executor.submit(fn, *args, **kwargs)
+        return future.result(timeout=seconds)
+    finally:
+        # wait=False: a with-block would join the worker on exit, blocking
+        # until fn returns and making the timeout decorative. The worker
+        # thread is left to finish (or die with the process) on its own.
+        executor.shutdown(wait=False, cancel_futures=True)
 
 class ProgramInterface:
-    
+
+    _instances = {}
+
+    @classmethod
+    def get(cls, model: str = 'code-davinci-002', stop: str = '\n\n', verbose: bool = False):
+        """Return a process-wide shared interface for (model, stop, verbose).
+
+        Roles keep conversation state in their own history_message, so one
+        instance can serve all of them; sharing it means every role call
+        rides the same underlying OpenAI/httpx client and its keep-alive
+        connection pool instead of paying per-role TLS handshakes."""
+        key = (model, stop, verbose)
+        instance = cls._instances.get(key)
+        if instance is None:
+            instance = cls._instances[key] = cls(model=model, stop=stop, verbose=verbose)
+        return instance
+
     def __init__(
         self,
         model: str = 'code-davinci-002',
@@ -45,18 +70,39 @@ class ProgramInterface:
     def process_generation_to_code(self, gens: str):
         return [g.split('\n') for g in gens]
     
-    def generate(self, prompt: str, temperature: float =0.0, top_p: float =1.0, 
-            max_tokens: int =512, majority_at: int =None, echo: bool =False, return_logprobs: bool =False):
+    async def generate(self, prompt: str =None, temperature: float =0.0, top_p: float =1.0,
+            max_tokens: int =512, majority_at: int =None, echo: bool =False, return_logprobs: bool =False,
+            cacheable_prefix: list =None, mutable_suffix: list =None, stream: bool =False):
+
+        # The cacheable prefix (static role description + requirement) is sent
+        # first and never truncated, so the provider's prompt cache can reuse
+        # its KV activations across rounds; only the suffix is mutable.
+        if cacheable_prefix is not None or mutable_suffix is not None:
+            prompt = list(cacheable_prefix or []) + list(mutable_suffix or [])
+            num_prefix_messages = len(cacheable_prefix or [])
+        else:
+            num_prefix_messages = 1
+
+        prompt = materialize_messages(prompt)
+
+        # Single-sample requests (every role call with majority == 1) always
+        # stream: the response accumulates while it decodes instead of
+        # waiting for the full body. Multi-sample n= requests cannot stream.
+        if majority_at is None or majority_at <= 1:
+            stream = True
 
         if 'davinci' not in self.model:
-            gens = call_chatgpt(prompt, model=self.model, stop=self.stop, 
-                temperature=temperature, top_p=top_p, max_tokens=max_tokens, echo=echo, majority_at=majority_at)
-            
+            gens = await acall_chatgpt(prompt, model=self.model, stop=self.stop,
+                temperature=temperature, top_p=top_p, max_tokens=max_tokens, echo=echo, majority_at=majority_at,
+                num_prefix_messages=num_prefix_messages, stream=stream)
+
         return gens
-    
-    def run(self, prompt: str, time_out: float =10, temperature: float =0.0, top_p: float =1.0, 
-            max_tokens: int =512, majority_at: int =None, echo=False, return_logprobs: bool =False):
-        code_snippets = self.generate(prompt, majority_at=majority_at, temperature=temperature, top_p=top_p, max_tokens=max_tokens, echo=echo, return_logprobs=return_logprobs)
+
+    async def run(self, prompt: str =None, time_out: float =10, temperature: float =0.0, top_p: float =1.0,
+            max_tokens: int =512, majority_at: int =None, echo=False, return_logprobs: bool =False,
+            cacheable_prefix: list =None, mutable_suffix: list =None, stream: bool =False):
+        code_snippets = await self.generate(prompt, majority_at=majority_at, temperature=temperature, top_p=top_p, max_tokens=max_tokens, echo=echo, return_logprobs=return_logprobs,
+            cacheable_prefix=cacheable_prefix, mutable_suffix=mutable_suffix, stream=stream)
 
         return code_snippets
     
\ No newline at end of file
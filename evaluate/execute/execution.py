@@ -7,6 +7,7 @@ libgcc_s = ctypes.CDLL('libgcc_s.so.1')
 from collections import defaultdict
 from concurrent.futures import as_completed, ProcessPoolExecutor
 import logging
+import os
 
 from execute._execution import check_correctness, check_correctness_with_test_cases, check_correctness_T
 
@@ -20,11 +21,16 @@ logger = logging.getLogger(__name__)
 
 def evaluate_with_test_code(
     samples,
-    timeout
+    timeout,
+    executor=None
 ):
     # logger.info(f'Start evaluation with test code, timeout={timeout}')
-    # Check the generated samples against test suites.
-    with ProcessPoolExecutor() as executor:
+    # Check the generated samples against test suites. Callers evaluating
+    # several sample sets can pass one executor and reuse its worker pool.
+    owned_executor = None
+    if executor is None:
+        executor = owned_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    try:
 
         futures = []
         existed_completion = defaultdict(set)
@@ -48,6 +54,9 @@ def evaluate_with_test_code(
             # logger.info('[{}/{}] execution completed'.format(idx+1, len(futures)))
             result = future.result()
             results[result["task_id"]][result["completion"]] = result
+    finally:
+        if owned_executor is not None:
+            owned_executor.shutdown()
 
     # logger.info('execution finished! start parsing results')
     samples_with_result = []
@@ -105,11 +114,15 @@ def evaluate_with_test_cases(
 
 def evaluate_with_test_code_T(
     samples,
-    timeout
+    timeout,
+    executor=None
 ):
     # logger.info(f'Start evaluation with test code, timeout={timeout}')
     # Check the generated samples against test suites.
-    with ProcessPoolExecutor() as executor:
+    owned_executor = None
+    if executor is None:
+        executor = owned_executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    try:
 
         futures = []
         existed_completion = defaultdict(set)
@@ -133,6 +146,9 @@ def evaluate_with_test_code_T(
             # logger.info('[{}/{}] execution completed'.format(idx+1, len(futures)))
             result = future.result()
             results[result["task_id"]][result["completion"]] = result
+    finally:
+        if owned_executor is not None:
+            owned_executor.shutdown()
 
     # logger.info('execution finished! start parsing results')
     samples_with_result = []
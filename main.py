@@ -1,83 +1,219 @@
-import os
-import copy
-import json
-import argparse
-import tqdm
-
-from session import Session
-from datasets import load_dataset, load_from_disk
-from utils import prompt_split_humaneval, find_method_name, code_split, build_test_method
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--dataset', type=str, default='humaneval')
-parser.add_argument('--lang', type=str, default='python')
-parser.add_argument('--output_path', type=str, default='output.jsonl')
-
-parser.add_argument('--signature', action='store_true')
-parser.add_argument('--model', type=str, default='gpt-3.5-turbo-0301')
-parser.add_argument('--max_round', type=int, default=2)
-
-parser.add_argument('--max_tokens', type=int, default=512) 
-parser.add_argument('--majority', type=int, default=1)
-parser.add_argument('--temperature', type=float, default=0.0)
-parser.add_argument('--top_p', type=float, default=0.95)
-
-parser.add_argument('--fail_list', type=list, default=[])
-parser.add_argument('--append', action='store_true')
-parser.add_argument('--verbose', action='store_true')
-parser.add_argument("--timeout", type=float, default=10, help="how many seconds to wait during execution for each test case")
-args = parser.parse_args()
-
-
-if __name__ == '__main__':
-    from roles.rule_descriptions_actc import TEAM, ANALYST, PYTHON_DEVELOPER, TESTER
-
-    OUTPUT_PATH = args.output_path
-
-    # load dataset
-    if args.dataset == 'humaneval':
-        if args.lang == 'python':
-            dataset = load_dataset("openai_humaneval")
-            dataset_key = ["test"]
-
-    with open(OUTPUT_PATH, 'w+') as f:
-        for key in dataset_key:
-            pbar = tqdm.tqdm(dataset[key], total=len(dataset[key]))
-            for idx, task in enumerate(pbar):
-                
-                if args.dataset == 'humaneval':
-                    method_name = task['entry_point']
-                    before_func, signature, intent, public_test_case = prompt_split_humaneval(task['prompt'],method_name)
-                    args.signature = True
-                    if args.signature:
-                        intent = task['prompt']
-                    
-                    test = task['test']
-
-                try:
-                    session = Session(TEAM, ANALYST, PYTHON_DEVELOPER, TESTER,requirement=intent, model=args.model, majority=args.majority, 
-                                    max_tokens=args.max_tokens, temperature=args.temperature, 
-                                    top_p=args.top_p, max_round=args.max_round, before_func=before_func)
-                    
-                    code, session_history = session.run_session()
-
-                except RuntimeError as e:
-                    print(str(e))
-                    print("task-%d fail"%(task['task_id']))
-                    fail_list.append(task['task_id'])
-                    continue
-
-                if  code == "error":
-                    continue
-
-                entry_point = find_method_name(code)
-                solution = {
-                    'task_id': task['task_id'],
-                    'prompt': before_func+"\n",
-                    'test': test,
-                    'entry_point': entry_point,
-                    'completion': code,
-                    'session_history': session_history,
-                }
-                f.write(json.dumps(solution) + '\n')
-                f.flush()
+import os
+import orjson
+import asyncio
+import argparse
+import tqdm
+import tqdm.asyncio
+
+from session import Session
+from utils import get_dataset, prompt_split_humaneval, find_method_name, code_split, build_test_method
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--dataset', type=str, default='humaneval')
+parser.add_argument('--lang', type=str, default='python')
+parser.add_argument('--output_path', type=str, default='output.jsonl')
+
+parser.add_argument('--signature', action='store_true')
+parser.add_argument('--model', type=str, default='gpt-3.5-turbo-0301')
+parser.add_argument('--max_round', type=int, default=2)
+
+parser.add_argument('--max_tokens', type=int, default=512)
+parser.add_argument('--majority', type=int, default=1)
+parser.add_argument('--concurrency', type=int, default=8, help="how many tasks to run against the API at once")
+parser.add_argument('--batch', action='store_true', help="route generation through the OpenAI Batch API, one batch per role turn")
+parser.add_argument('--no-cache', dest='no_cache', action='store_true', help="skip the on-disk cache of deterministic (temperature=0) completions")
+parser.add_argument('--temperature', type=float, default=0.0)
+parser.add_argument('--top_p', type=float, default=0.95)
+
+parser.add_argument('--fail_list', type=list, default=[])
+parser.add_argument('--append', action='store_true')
+parser.add_argument('--verbose', action='store_true')
+parser.add_argument("--timeout", type=float, default=10, help="how many seconds to wait during execution for each test case")
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    from roles.rule_descriptions_actc import TEAM, ANALYST, PYTHON_DEVELOPER, TESTER
+
+    if args.no_cache:
+        from core import backend
+        backend.cache_enabled = False
+
+    OUTPUT_PATH = args.output_path
+
+    # load dataset
+    if args.dataset == 'humaneval':
+        if args.lang == 'python':
+            dataset = {"test": get_dataset("openai_humaneval")}
+            dataset_key = ["test"]
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    write_lock = asyncio.Lock()
+    written = [0]
+
+    async def process_task(task, f):
+        async with semaphore:
+
+            if args.dataset == 'humaneval':
+                method_name = task['entry_point']
+                before_func, signature, intent, public_test_case = prompt_split_humaneval(task['prompt'],method_name)
+                args.signature = True
+                if args.signature:
+                    intent = task['prompt']
+
+                test = task['test']
+
+            try:
+                session = Session(TEAM, ANALYST, PYTHON_DEVELOPER, TESTER,requirement=intent, model=args.model, majority=args.majority,
+                                max_tokens=args.max_tokens, temperature=args.temperature,
+                                top_p=args.top_p, max_round=args.max_round, before_func=before_func)
+
+                code, session_history = await session.run_session()
+
+            except RuntimeError as e:
+                print(str(e))
+                print("task-%d fail"%(task['task_id']))
+                args.fail_list.append(task['task_id'])
+                return
+
+            if  code == "error":
+                return
+
+            entry_point = find_method_name(code)
+            solution = {
+                'task_id': task['task_id'],
+                'prompt': before_func+"\n",
+                'test': test,
+                'entry_point': entry_point,
+                'completion': code,
+                'session_history': session_history,
+            }
+            async with write_lock:
+                f.write(orjson.dumps(solution, option=orjson.OPT_APPEND_NEWLINE))
+                written[0] += 1
+                if written[0] % 16 == 0:
+                    f.flush()
+
+    async def main_async():
+        with open(OUTPUT_PATH, 'wb', buffering=1<<20) as f:
+            for key in dataset_key:
+                tasks = [asyncio.create_task(process_task(task, f)) for task in dataset[key]]
+                await tqdm.asyncio.tqdm.gather(*tasks)
+
+    def main_batch():
+        # Batch-mode replays the Session round structure, but dispatches the
+        # prompts of all tasks for a given role turn as one Batch API job:
+        # analyst turn, then per round a coder turn and a tester turn.
+        from session import unsafe_execute
+        from core.backend import call_chatgpt_batch
+        from core.interface import materialize_messages
+        from roles.instruction import INSTRUCTEST
+        from utils import code_truncate
+
+        def dispatch(prompts):
+            prompts = {task_id: materialize_messages(history) for task_id, history in prompts.items()}
+            return call_chatgpt_batch(prompts, model=args.model, temperature=args.temperature,
+                                      top_p=args.top_p, max_tokens=args.max_tokens)
+
+        states = {}
+        for key in dataset_key:
+            for task in dataset[key]:
+                if args.dataset == 'humaneval':
+                    method_name = task['entry_point']
+                    before_func, signature, intent, public_test_case = prompt_split_humaneval(task['prompt'],method_name)
+                    args.signature = True
+                    if args.signature:
+                        intent = task['prompt']
+
+                    test = task['test']
+
+                session = Session(TEAM, ANALYST, PYTHON_DEVELOPER, TESTER,requirement=intent, model=args.model, majority=args.majority,
+                                max_tokens=args.max_tokens, temperature=args.temperature,
+                                top_p=args.top_p, max_round=args.max_round, before_func=before_func)
+                states[task['task_id']] = {'task': task, 'session': session, 'before_func': before_func,
+                                           'test': test, 'report': '', 'code': '', 'is_init': True, 'done': False}
+
+        # analyst turn
+        plans = dispatch({task_id: s['session'].analyst.history_message for task_id, s in states.items()})
+        for task_id, s in states.items():
+            plan = plans.get(task_id)
+            if plan is None:
+                s['code'] = "error"
+                s['done'] = True
+                continue
+            s['session'].analyst.history_message_append(plan, "assistant")
+            s['session'].session_history["plan"] = plan
+            s['report'] = plan
+
+        for i in range(args.max_round):
+            pending = {task_id: s for task_id, s in states.items() if not s['done']}
+            if not pending:
+                break
+
+            # coder turn
+            prompts = {}
+            for task_id, s in pending.items():
+                coder = s['session'].coder
+                coder.construct_with_report(s['report'], s['is_init'])
+                prompts[task_id] = coder.history_message
+            responses = dispatch(prompts)
+            for task_id, s in pending.items():
+                coder = s['session'].coder
+                response = responses.get(task_id)
+                naivecode = code_truncate(response) if response else ""
+                coder.history_message.pop()
+                coder.history_message_append(naivecode, "assistant")
+                if find_method_name(naivecode):
+                    s['code'] = naivecode
+
+                if s['code'].strip() == "":
+                    s['code'] = "error" if i == 0 else s['session'].session_history['Round_{}'.format(i-1)]["code"]
+                    s['done'] = True
+                elif i == args.max_round-1:
+                    s['session'].session_history['Round_{}'.format(i)] = {"code": s['code']}
+                    s['done'] = True
+
+            # tester turn
+            prompts = {}
+            for task_id, s in pending.items():
+                if s['done']:
+                    continue
+                tester = s['session'].tester
+                tester.history_message_append(INSTRUCTEST.format(code=s['code']))
+                prompts[task_id] = tester.history_message
+            tests_responses = dispatch(prompts) if prompts else {}
+            for task_id in prompts:
+                s = states[task_id]
+                tests = tests_responses.get(task_id)
+                if tests is None:
+                    s['code'] = "error"
+                    s['done'] = True
+                    continue
+                s['session'].tester.history_message_append(tests, "assistant")
+                test_report = code_truncate(tests)
+                method_name = find_method_name(s['code'])
+                answer_report = unsafe_execute(s['before_func']+s['code']+'\n'+test_report+'\n'+f'check({method_name})', '')
+                s['report'] = f'The compilation output of the preceding code is: {answer_report}'
+                s['is_init'] = False
+                s['session'].session_history['Round_{}'.format(i)] = {"code": s['code'], "report": s['report']}
+                if answer_report == "Code Test Passed.":
+                    s['done'] = True
+
+        with open(OUTPUT_PATH, 'wb', buffering=1<<20) as f:
+            for task_id, s in states.items():
+                if s['code'] == "error":
+                    continue
+                solution = {
+                    'task_id': task_id,
+                    'prompt': s['before_func']+"\n",
+                    'test': s['test'],
+                    'entry_point': find_method_name(s['code']),
+                    'completion': s['code'],
+                    'session_history': s['session'].session_history,
+                }
+                f.write(orjson.dumps(solution, option=orjson.OPT_APPEND_NEWLINE))
+
+    if args.batch:
+        main_batch()
+    else:
+        asyncio.run(main_async())
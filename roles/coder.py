@@ -1,16 +1,25 @@
-import os
-import openai
-import time
-import copy
-import json
-import argparse
-import tqdm
+import asyncio
 
 from core import interface
+from core.backend import max_context_length
 from utils import code_truncate, construct_system_message
 from roles.instruction import INSTRUCTPLAN, INSTRUCTREPORT, INSTRUCTCODE
 
+def _iter_paragraphs(text):
+    # Lazy equivalent of text.split('\n\n'): same segments, yielded from a
+    # single C-level find scan instead of materializing the full list.
+    pos = 0
+    sep = text.find('\n\n')
+    while sep >= 0:
+        yield text[pos:sep]
+        pos = sep + 2
+        sep = text.find('\n\n', pos)
+    yield text[pos:]
+
 class Coder(object):
+    __slots__ = ('model', 'majority', 'max_tokens', 'temperature', 'top_p',
+                 'history_message', 'requirement', 'itf', '_instructcode_rendered')
+
     def __init__(self, TEAM, PYTHON_DEVELOPER, requirement, model='gpt-3.5-turbo-0301', majority=1, max_tokens=512,
                                 temperature=0.0, top_p=1.0):
         self.model = model
@@ -21,44 +30,64 @@ class Coder(object):
         self.history_message = []
         self.requirement = requirement
 
-        self.itf = interface.ProgramInterface(
-            stop='',
-            verbose=False,
-            model = self.model,
-        )
+        self.itf = interface.ProgramInterface.get(model=self.model, stop='', verbose=False)
 
-        system_message = construct_system_message(requirement, PYTHON_DEVELOPER, TEAM)
+        static_prefix, dynamic_suffix = construct_system_message(requirement, PYTHON_DEVELOPER, TEAM)
 
-        self.history_message_append(system_message)
+        self.history_message_append(static_prefix)
+        self.history_message_append(dynamic_suffix)
 
-    def implement(self, report, is_init=False):
+        # Rendered once: the requirement never changes within a session, so
+        # re-formatting this template every round would produce the same
+        # bytes (and a fresh string) each time.
+        self._instructcode_rendered = INSTRUCTCODE.format(requirement=requirement)
+
+    async def implement(self, report, is_init=False):
         self.construct_with_report(report, is_init)
         
         try:
-            responses = self.itf.run(prompt=self.history_message, majority_at = self.majority, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p)
+            responses = await self.itf.run(cacheable_prefix=self.history_message[:2], mutable_suffix=self.history_message[2:], majority_at = self.majority, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p)
         except Exception as e:
             print(e)
             print("implement fail")
-            time.sleep(5)
+            await asyncio.sleep(5)
             return "error"
         
         if 'gpt' not in self.model:
             generation = responses[0][responses[0].find("def"):]
-            tem = [s for s in generation.split('\n\n') if 'def ' in s or s[:1] == ' ']
-            code = '\n\n'.join(tem).strip('```').strip()
+            code = '\n\n'.join(
+                para for para in _iter_paragraphs(generation)
+                if 'def ' in para or para[:1] == ' '
+            ).strip('`').strip()
         else:
             code = code_truncate(responses[0])
         
-        self.history_message = self.history_message[:-1]
+        self.history_message.pop()
         self.history_message_append(code, "assistant")
-    
+        self._compact_history()
+
         return code
-    
+
+    def _compact_history(self, keep_rounds=1):
+        # Each round leaves two messages behind (report instruction +
+        # assistant code). Drop the oldest rounds proactively once the
+        # estimated prompt nears the context limit (~4 chars per token),
+        # instead of waiting for the API to reject the call.
+        budget = 0.9 * max_context_length(self.model) - self.max_tokens
+        estimated_tokens = sum(len(content) for _, content in self.history_message) // 4
+        if estimated_tokens <= budget:
+            return
+
+        prefix = self.history_message[:2]
+        tail = self.history_message[2:]
+        keep = 2 * keep_rounds
+        if len(tail) > keep:
+            self.history_message = prefix + tail[-keep:]
+
     def history_message_append(self, system_message, role="user"):
-        self.history_message.append({
-            "role": role,
-            "content": system_message
-        })
+        # (role, content) tuples: ~4x smaller than per-message dicts; the
+        # interface materializes dicts only when a request is actually sent.
+        self.history_message.append((role, system_message))
         
     def construct_with_report(self, report, is_init=False):
         if report != "":
@@ -67,4 +96,4 @@ class Coder(object):
             else:
                 instruction = INSTRUCTREPORT.format(report=report.strip())
             self.history_message_append(instruction)
-            self.history_message_append(INSTRUCTCODE.format(requirement=self.requirement))
+            self.history_message_append(self._instructcode_rendered)
@@ -1,16 +1,39 @@
 import json
 import re
 import ast
+import os
 import time
 import difflib
 import copy
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4)
+def get_dataset(name, key='test'):
+    '''
+    Load a HuggingFace dataset split once per process; every caller shares
+    the same memory-mapped split instead of re-reading the Parquet files.
+    '''
+    from datasets import load_dataset
+    if os.environ.get('HF_HOME') and 'HF_DATASETS_OFFLINE' not in os.environ:
+        os.environ['HF_DATASETS_OFFLINE'] = '1'
+    return load_dataset(name)[key]
 
 
 def code_truncate_regex(code):
-    code_regex = r"```(.*?|)\n(?P<code>.*?)```"
-    match = re.search(code_regex, code, re.DOTALL)
-    code = match.group("code") if match else ""
-    return code
+    # Three C-level substring scans instead of a lazy-quantifier DOTALL
+    # regex: the opening fence, the end of its language tag line, and the
+    # closing fence. Same result as the old pattern, no backtracking.
+    start = code.find("```")
+    if start < 0:
+        return ""
+    body_start = code.find("\n", start + 3)
+    if body_start < 0:
+        return ""
+    end = code.find("```", body_start + 1)
+    if end < 0:
+        return ""
+    return code[body_start + 1:end]
     
 def code_truncate(response):
     code = code_truncate_regex(response)
@@ -20,23 +43,33 @@ def code_truncate(response):
         code = '\n\n'.join(tem).strip('```').strip()
     return code
 
+# prompt_split_humaneval runs once per task; its fixed patterns are
+# compiled here so only the method-name pattern is built per call.
+_DOC_DQ_RE = re.compile("\"\"\"")
+_DOC_SQ_RE = re.compile("\'\'\'")
+_EXAMPLE_RE = re.compile("[eE]xample(:)?")
+_FOR_EXAMPLE_RE = re.compile("[fF]or [eE]xamble(:)?")
+_DOCTEST_RE = re.compile(">>>")
+_WS_RUN_RE = re.compile("\s+")
+_LINE_INDENT_RE = re.compile("\n(\s)*")
+
 def prompt_split_humaneval(prompt, mehotd_name):
     prompt = prompt.strip()
     prompt = prompt.replace("\r\n", "\n")
     before_func = prompt[:prompt.rfind("def ")]
     code = prompt[prompt.rfind("def "):]
 
-    comment_start_1 = re.search("\"\"\"", code)
-    comment_start_2 = re.search("\'\'\'", code)
+    comment_start_1 = _DOC_DQ_RE.search(code)
+    comment_start_2 = _DOC_SQ_RE.search(code)
     if comment_start_1:
         comment_start = comment_start_1.end()
     elif comment_start_2:
         comment_start = comment_start_2.end()
 
 
-    example_start_1 = re.search("[eE]xample(:)?", code)
-    example_start_2 = re.search("[fF]or [eE]xamble(:)?", code)
-    example_start_3 = re.search(">>>", code)
+    example_start_1 = _EXAMPLE_RE.search(code)
+    example_start_2 = _FOR_EXAMPLE_RE.search(code)
+    example_start_3 = _DOCTEST_RE.search(code)
     example_start_4 = re.search(mehotd_name+"\(.+\)", code[comment_start:])
 
 
@@ -56,9 +89,9 @@ def prompt_split_humaneval(prompt, mehotd_name):
         comment = code[comment_start:-4]
         example = ""
     comment = comment.strip().replace("\n", " ")
-    comment = re.sub("\s+", " ", comment)
+    comment = _WS_RUN_RE.sub(" ", comment)
 
-    example = re.sub("\n(\s)*","\n\t",example)
+    example = _LINE_INDENT_RE.sub("\n\t", example)
     test_case = "\t"+example.strip()
     signature = code[:code.index("\n")+1]
 
@@ -110,7 +143,9 @@ def code_split(func):
         s = s.strip()
         if s.startswith("def"):
             signature = statements[:s_idx+1]
-            method_name = s.split("def ")[1].split("(")[0]
+            # partition returns the one piece we need without building
+            # intermediate lists the way split does
+            method_name = s.partition("def ")[2].partition("(")[0]
             func_body_idx = s_idx+1
             tmp_statement = statements[func_body_idx].strip()
             if not tmp_statement.startswith("'''"):
@@ -127,13 +162,20 @@ def code_split(func):
     func_body = statements[func_body_idx:]
     return method_name, "\n".join(signature), "\n".join(comments), "\n".join(func_body), before_func
 
+@lru_cache(maxsize=256)
 def construct_system_message(requirement, role, team=''):
+    '''
+    Return (static_prefix, dynamic_suffix). The prefix holds only the team
+    and role descriptions, so it is byte-identical for every task and the
+    provider's prompt-prefix cache can reuse it; the per-task requirement
+    lives in the suffix.
+    '''
     if team == '':
-        system_message = "The requirement from users is: \n{'requirement':\n"  +  "'"+ requirement.replace('\n\n','\n').strip(".") + "'\n}\n\n" + role
+        static_prefix = role
     else:
-        system_message = team + '\n '+ \
-                    "The requirement from users is: \n{'requirement':\n"  +  "'"+ requirement.replace('\n\n','\n').strip(".") + "'\n}\n\n" + \
-                    role
-                
-    return system_message
+        static_prefix = team + '\n ' + role
+
+    dynamic_suffix = "The requirement from users is: \n{'requirement':\n"  +  "'"+ requirement.replace('\n\n','\n').strip(".") + "'\n}"
+
+    return static_prefix, dynamic_suffix
     
\ No newline at end of file